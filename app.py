@@ -1,23 +1,41 @@
 import streamlit as st
 import json
+import re
+import string
+import copy
+import asyncio
+import functools
 from docx import Document
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import nsdecls, qn
 from docx.shared import Pt
+from docx.text.paragraph import Paragraph
 from docx.enum.text import WD_LINE_SPACING
 from io import BytesIO
-from openai import OpenAI
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import os
+import time
+
+@st.cache_resource
+def load_template_bytes(file):
+    """Read a docx template from disk once and keep its raw bytes"""
+    with open(file, "rb") as f:
+        return f.read()
 
 def load_docx(file):
     """Load a docx file into a Document object"""
-    return Document(file)
+    # Each build opens its own Document from the in-memory bytes instead of rereading the file
+    return Document(BytesIO(load_template_bytes(file)))
 
 def find_section(doc, section_title):
-    """Find the paragraph index where a section begins"""
-    for i, para in enumerate(doc.paragraphs):
-        if section_title.upper() in para.text.strip().upper():
-            return i
-    return -1
+    """Find the <w:p> element where a section begins"""
+    target = section_title.upper()
+    # Section headings are top-level paragraphs, so tables and text boxes are not searched
+    for p in doc.element.body.iterchildren(qn('w:p')):
+        if target in ''.join(t.text for t in p.iter(qn('w:t')) if t.text).upper():
+            return p
+    return None
 
 def parse_and_format_bullet(bullet_text):
     """
@@ -30,96 +48,148 @@ def parse_and_format_bullet(bullet_text):
         (" that increased deployment speed by ", False),
         ("80%", True)
     ]
+    
+    Text between a complete pair of ** markers is bold. A stray unpaired ** is kept as
+    plain text, and pairs before it are still bolded.
     """
-    segments = []
+    # Most bullets have no bold markers, so skip splitting them
+    if "**" not in bullet_text:
+        return [(bullet_text, False)] if bullet_text else []
+    
     parts = bullet_text.split("**")
     
-    # If odd number of ** markers, it's properly formatted
-    # If even number, it's malformed (odd number of ** symbols)
+    # An odd number of ** markers leaves the last one unpaired; keep it in the plain text
     if len(parts) % 2 == 0:
-        # Just return the text as-is without bold
-        return [(bullet_text, False)]
+        tail = parts.pop()
+        parts[-1] += "**" + tail
     
-    for i, part in enumerate(parts):
+    # Parts alternate between normal and bold text, starting with normal
+    segments = []
+    is_bold = False
+    for part in parts:
         if part:  # Skip empty strings that can occur with back-to-back **
-            # Even-indexed parts are normal text, odd-indexed are bold
-            is_bold = (i % 2 == 1)
             segments.append((part, is_bold))
-    
+        is_bold = not is_bold
     return segments
 
-def add_content_to_section(doc, section_title, content_json):
-    """Add all content from JSON to a specific section"""
-    section_idx = find_section(doc, section_title)
+FONT_NAME = "Times New Roman"
+FONT_SIZE_11 = Pt(11)
+FONT_SIZE_12 = Pt(12)
+
+def make_run_properties(size, bold=False, italic=False):
+    """Build a reusable <w:rPr> template for FONT_NAME text at the given size"""
+    return parse_xml(
+        f'<w:rPr {nsdecls("w")}><w:rFonts w:ascii="{FONT_NAME}" w:hAnsi="{FONT_NAME}"/>'
+        f'{"<w:b/>" if bold else ""}{"<w:i/>" if italic else ""}'
+        f'<w:sz w:val="{round(size.pt * 2)}"/></w:rPr>'
+    )
+
+# Run properties are built once and copied into each run instead of being set through
+# the Font proxy: 11pt for body text, bold for highlights, and bold italic 12pt for
+# role/project titles
+RPR_NORMAL = make_run_properties(FONT_SIZE_11)
+RPR_BOLD = make_run_properties(FONT_SIZE_11, bold=True)
+RPR_TITLE = make_run_properties(FONT_SIZE_12, bold=True, italic=True)
+
+PT_ZERO = Pt(0)
+PT_HALF = Pt(0.5)
+
+def make_paragraph_properties(space_before=None, space_after=None, line_spacing=None):
+    """Build a reusable <w:pPr> template through a single paragraph_format access"""
+    p = OxmlElement('w:p')
+    paragraph_format = Paragraph(p, None).paragraph_format
+    if space_before is not None:
+        paragraph_format.space_before = space_before
+    if space_after is not None:
+        paragraph_format.space_after = space_after
+    if line_spacing is not None:
+        paragraph_format.line_spacing = line_spacing
+    return p.pPr
+
+# Paragraph properties are likewise built once and copied into each new paragraph
+PPR_TITLE = make_paragraph_properties(space_after=PT_ZERO)
+PPR_BULLET = make_paragraph_properties(space_after=PT_ZERO, line_spacing=1.0)
+PPR_SPACER = make_paragraph_properties(space_after=PT_HALF)
+PPR_SKILL = make_paragraph_properties(space_before=PT_ZERO, space_after=PT_ZERO, line_spacing=1.0)
+
+def new_paragraph(ppr):
+    """Create a <w:p> element with a copy of the given paragraph properties"""
+    p = OxmlElement('w:p')
+    p.append(copy.deepcopy(ppr))
+    return p
+
+# Tabs and line breaks need their own <w:tab/> and <w:br/> elements rather than <w:t> text
+RUN_BREAK_RE = re.compile(r'[\t\r\n]')
+
+def add_formatted_run(p, text, rpr):
+    """Append a run with a copy of the given run properties to a <w:p> element"""
+    r = OxmlElement('w:r')
+    r.append(copy.deepcopy(rpr))
     
-    if section_idx == -1:
-        st.error(f"Could not find section: {section_title}")
-        return False
+    if RUN_BREAK_RE.search(text):
+        # Let python-docx split the text into <w:t>, <w:tab/> and <w:br/> elements
+        r.text = text
+    else:
+        # Always preserve spaces: segments split around bold text start or end with one
+        t = OxmlElement('w:t', {qn('xml:space'): 'preserve'})
+        t.text = text
+        r.append(t)
+    p.append(r)
+
+def build_section_xml(content_json):
+    """
+    Build the <w:p> elements for a section's roles/projects without inserting them
+    
+    Returns the title, bullet and spacer paragraphs in document order so the caller
+    can insert the whole section in one pass.
+    """
+    if not content_json:
+        return []
     
-    # Add JSON content after the section title
-    current_idx = section_idx + 1
+    paragraphs = []
+    last_item = content_json[-1]
     
     # For each role/project in the JSON
     for item in content_json:
         for title, bullets in item.items():
-            # Add the title
-            title_para = doc.add_paragraph()
-            title_run = title_para.add_run(title)
-            
-            # Format the title
-            title_run.font.name = "Times New Roman"
-            title_run.font.size = Pt(12)
-            title_run.font.italic = True
-            title_run.bold = True
-            
-            # Add space before paragraph for title
-            title_para.paragraph_format.space_after = Pt(0)
-            
-            # Insert at current position
-            p = title_para._element
-            doc.paragraphs[current_idx]._p.addprevious(p)
-            current_idx += 1
+            # Add the title, with no space after it
+            title_p = new_paragraph(PPR_TITLE)
+            add_formatted_run(title_p, title, RPR_TITLE)
+            paragraphs.append(title_p)
             
             # Add bullet points with proper formatting
             for bullet in bullets:
-                # Create a new paragraph
-                bullet_para = doc.add_paragraph()
-                
+                # Create a new single-spaced paragraph with no space after it
+                bullet_p = new_paragraph(PPR_BULLET)
                 
                 # Parse the bullet text for bold segments
                 segments = parse_and_format_bullet(bullet)
                 
                 # Add the bullet character first (without making it bold)
-                bullet_run = bullet_para.add_run("• ")
-                bullet_run.font.name = "Times New Roman"
-                bullet_run.font.size = Pt(11)
+                add_formatted_run(bullet_p, "• ", RPR_NORMAL)
                 
                 # Add each text segment with appropriate formatting
                 for text, is_bold in segments:
-                    run = bullet_para.add_run(text)
-                    run.font.name = "Times New Roman"
-                    run.font.size = Pt(11)
-                    run.bold = is_bold
-                
-                # Set line spacing to 1.0 (single spacing)
-                paragraph_format = bullet_para.paragraph_format
-                paragraph_format.line_spacing = 1.0
-                
-                # Remove space after paragraph
-                paragraph_format.space_after = Pt(0)
-                
-                
-                
-                # Insert at current position
-                p = bullet_para._element
-                doc.paragraphs[current_idx]._p.addprevious(p)
-                current_idx += 1
-            if item != content_json[-1] :
-              space_para = doc.add_paragraph()
-              space_para.paragraph_format.space_after = Pt(0.5)
-              p = space_para._element
-              doc.paragraphs[current_idx]._p.addprevious(p)
-              current_idx += 1 
+                    add_formatted_run(bullet_p, text, RPR_BOLD if is_bold else RPR_NORMAL)
+                paragraphs.append(bullet_p)
+        
+        # Separate this role/project from the next one
+        if item is not last_item:
+            paragraphs.append(new_paragraph(PPR_SPACER))
+    return paragraphs
+
+def add_content_to_section(doc, section_title, content_json):
+    """Add all content from JSON to a specific section"""
+    section_p = find_section(doc, section_title)
+    
+    if section_p is None:
+        st.error(f"Could not find section: {section_title}")
+        return False
+    
+    # Insert the prebuilt section before the paragraph that follows the section title
+    anchor = section_p.getnext()
+    for p in build_section_xml(content_json):
+        anchor.addprevious(p)
     return True
 
 def save_docx(doc):
@@ -149,52 +219,86 @@ def parse_and_format_skill(skill_text):
     # Otherwise, return as is (not bold)
     return [(skill_text, False)]
 
-def add_skills_to_section(doc, section_title, skills_list):
-    """Add skills to the TECHNICAL SKILLS section of the resume"""
-    section_idx = find_section(doc, section_title)
-    
-    if section_idx == -1:
-        st.error(f"Could not find section: {section_title}")
-        return False
-    
-    # Add skills after the section title
-    current_idx = section_idx + 1
+def build_skills_xml(skills_list):
+    """Build the <w:p> elements for the skill categories without inserting them"""
+    paragraphs = []
     
     # Process each skill category (e.g., "Programming Languages:", "Software Development:", etc.)
     for skill_category in skills_list:
-        # Create a new paragraph for the skill category
-        skill_para = doc.add_paragraph()
+        # Create a new single-spaced paragraph with no space before or after it
+        skill_p = new_paragraph(PPR_SKILL)
         
         # Parse the skill text for bold sections (usually the category name)
         segments = parse_and_format_skill(skill_category)
         
         # Add each segment with appropriate formatting
         for text, is_bold in segments:
-            run = skill_para.add_run(text)
-            run.font.name = "Times New Roman"
-            run.font.size = Pt(11)
-            run.bold = is_bold
-        
-        # No spaces before or after paragraph
-        paragraph_format = skill_para.paragraph_format
-        paragraph_format.space_before = Pt(0)
-        paragraph_format.space_after = Pt(0)
-        paragraph_format.line_spacing = 1.0
-        
-        # Insert at current position
-        p = skill_para._element
-        doc.paragraphs[current_idx]._p.addprevious(p)
-        current_idx += 1
+            add_formatted_run(skill_p, text, RPR_BOLD if is_bold else RPR_NORMAL)
+        paragraphs.append(skill_p)
     
+    return paragraphs
+
+def add_skills_to_section(doc, section_title, skills_list):
+    """Add skills to the TECHNICAL SKILLS section of the resume"""
+    section_p = find_section(doc, section_title)
+    
+    if section_p is None:
+        st.error(f"Could not find section: {section_title}")
+        return False
+    
+    # Insert the prebuilt skills before the paragraph that follows the section title
+    anchor = section_p.getnext()
+    for p in build_skills_xml(skills_list):
+        anchor.addprevious(p)
     return True
 
-def process_job_description(resume_json, job_description, model="gpt-4.1-nano"):
-    """Process job description with OpenAI API and get enhanced resume content"""
-    load_dotenv()
-    keymain = os.getenv("API_KEY")
-    client = OpenAI(api_key=keymain)
+@st.cache_data(ttl=3600, show_spinner=False)
+def build_resume_bytes(template_file, resume_data_json):
+    """
+    Fill the resume template with resume data and return the .docx file contents
+    
+    Cached on the template and the serialized resume data, so building the same resume
+    again (e.g. clicking Build Resume twice) returns the stored bytes.
+    """
+    resume_data = json.loads(resume_data_json)
+    
+    # Load document
+    doc = load_docx(template_file)
+    
+    # Add experience section
+    if "experience" in resume_data and resume_data["experience"]:
+        success = add_content_to_section(doc, "EXPERIENCE", resume_data["experience"])
+        if success:
+            st.success("✅ Added experience section")
+        else:
+            st.error("❌ Failed to add experience section")
     
-    system_prompt = """
+    # Add projects section
+    if "projects" in resume_data and resume_data["projects"]:
+        success = add_content_to_section(doc, "PROJECTS", resume_data["projects"])
+        if success:
+            st.success("✅ Added projects section")
+        else:
+            st.error("❌ Failed to add projects section")
+    
+    if "skills" in resume_data and resume_data["skills"]:
+        success = add_skills_to_section(doc, "TECHNICAL SKILLS", resume_data["skills"])
+        if success:
+            st.success("✅ Added technical skills section")
+        else:
+            st.error("❌ Failed to add technical skills section")
+    
+    return save_docx(doc).getvalue()
+
+# Cheap mode gives a batch this long to finish before falling back to an online request
+BATCH_TIMEOUT_SECONDS = 10 * 60
+BATCH_POLL_INITIAL_DELAY = 2
+BATCH_POLL_MAX_DELAY = 60
+
+# Streamed responses refresh their preview each time this many new characters arrive
+STREAM_PREVIEW_CHARS = 200
+
+SYSTEM_PROMPT = """
     You are a resume optimization assistant. Your task is to extract relevant keywords, skills, technologies, and role responsibilities 
     from the job description. Enhance the candidate's resume bullet points to closely align with these requirements. Prioritize quantifiable results, 
     action verbs, and technical keywords to maximize ATS (Applicant Tracking System) compatibility. Return output in valid JSON format only.
@@ -210,13 +314,59 @@ def process_job_description(resume_json, job_description, model="gpt-4.1-nano"):
     Don't duplicate existing skills. If new skills don't fit into existing categories, add them to the "Additional Skills" category.
     Make sure each skill category header is in bold with format: "**Category Name:** skill1, skill2, skill3"
     """
-    
-    user_prompt = f"""
+
+# Responses use strict structured outputs. Strict schemas need fixed property names, so
+# roles and projects are sent and returned as {"title": ..., "bullets": [...]} entries
+# rather than {title: bullets} objects
+ENTRY_SECTIONS = ("experience", "projects")
+
+ENTRY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "bullets": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["title", "bullets"],
+    "additionalProperties": False
+}
+
+SECTION_SCHEMAS = {
+    "experience": {"type": "array", "items": ENTRY_SCHEMA},
+    "projects": {"type": "array", "items": ENTRY_SCHEMA},
+    "skills": {"type": "array", "items": {"type": "string"}}
+}
+
+def object_schema(properties):
+    """Build a strict JSON schema object that requires every given property"""
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False
+    }
+
+def pack_section(section, content):
+    """Convert a resume section to the entry shape used in prompts and responses"""
+    if section in ENTRY_SECTIONS:
+        return [
+            {"title": title, "bullets": bullets}
+            for item in content
+            for title, bullets in item.items()
+        ]
+    return content
+
+def unpack_section(section, content):
+    """Convert a section from the entry shape back to the resume shape"""
+    if section in ENTRY_SECTIONS:
+        return [{entry["title"]: entry["bullets"]} for entry in content]
+    return content
+
+USER_PROMPT_TMPL = string.Template("""
     JOB DESCRIPTION:
-    {job_description}
+    ${job_description}
     
     RESUME DATA TO ENHANCE:
-    {json.dumps(resume_json)}
+    ${resume_json}
     
     INSTRUCTIONS:
     1. Carefully extract key responsibilities, required skills, technologies, and qualifications from the job description.
@@ -238,52 +388,307 @@ def process_job_description(resume_json, job_description, model="gpt-4.1-nano"):
        - If new skills don't fit existing categories, add them to "Additional Skills".
        - Keep the category header format: "**Category Name:** skill1, skill2, skill3"
        
-    6. Output updated content as JSON, keeping the structure identical to the input. Return only valid JSON in this format: 
-       {{
-         "experience": [
-           {{"role_name": ["bullet_point1 with **bold** terms", "bullet_point2", ...]}},
-           ...
-         ],
-         "projects": [
-           {{"project_name": ["bullet_point1", "bullet_point2 with **metrics**", ...]}},
-           ...
-         ],
-         "skills": [
-           "**Programming Languages:** Java, Python, etc.",
-           "**Software Development:** skill1, skill2, etc.",
-           ...
-         ]
-       }}
+    6. ${output_instructions}
        
     Goal: Maximize ATS score by aligning resume content with the job description while preserving professional tone and formatting.
+    """)
+
+SECTION_OUTPUT_INSTRUCTIONS = "Return the updated section, keeping its entries in the same order as the input."
+
+def get_client():
+    """Create an async OpenAI client from the API_KEY environment variable"""
+    load_dotenv()
+    keymain = os.getenv("API_KEY")
+    return AsyncOpenAI(api_key=keymain)
+
+def build_chat_request(user_prompt, model, schema_name, schema):
+    """Build the chat completion request body shared by online and batch requests"""
+    return {
+        "model": model,
+        # Strict structured outputs guarantee the response matches the schema
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": schema_name, "strict": True, "schema": schema}
+        },
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": 0.3  # Lower temperature for more consistent outputs
+    }
+
+async def request_enhancement(client, request, on_progress=None):
     """
+    Stream a chat request through the OpenAI API and return the parsed JSON response
     
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            response_format={"type": "json_object"},  # Force JSON response
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3  # Lower temperature for more consistent outputs
+    If on_progress is given it is called with the text received so far, about every
+    STREAM_PREVIEW_CHARS characters, so the UI can show the response as it is generated.
+    """
+    stream = await client.chat.completions.create(**request, stream=True)
+    
+    parts = []
+    received = shown = 0
+    async for chunk in stream:
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        parts.append(chunk.choices[0].delta.content)
+        received += len(parts[-1])
+        if on_progress and received - shown >= STREAM_PREVIEW_CHARS:
+            on_progress("".join(parts))
+            shown = received
+    
+    return json.loads("".join(parts))
+
+async def submit_batch(requests):
+    """
+    Upload chat requests as a JSONL file and start an OpenAI Batch API job for them
+    
+    Batch requests are billed at a discount but may take a while to run, so this only
+    starts the batch and returns its id; poll_batch checks on it later.
+    """
+    # Upload one JSONL line per request and start the batch
+    lines = [
+        json.dumps({
+            "custom_id": key,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": request
+        })
+        for key, request in requests.items()
+    ]
+    async with get_client() as client:
+        batch_file = await client.files.create(
+            file=("resume_batch.jsonl", BytesIO("\n".join(lines).encode())),
+            purpose="batch"
+        )
+        batch = await client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
         )
+        return batch.id
+
+async def read_batch_results(client, batch, requests):
+    """Return the parsed JSON of each successful response in a finished batch, by key"""
+    enhanced = {}
+    if batch.status != "completed" or not batch.output_file_id:
+        return enhanced
+    
+    output = await client.files.content(batch.output_file_id)
+    for result_line in output.text.splitlines():
+        result = json.loads(result_line)
+        response = result["response"]
+        # Failed lines have no response or a non-200 status; their keys are requested online
+        if result["custom_id"] in requests and response and response["status_code"] == 200:
+            enhanced[result["custom_id"]] = json.loads(response["body"]["choices"][0]["message"]["content"])
+    return enhanced
+
+async def poll_batch(batch_id, requests, deadline):
+    """
+    Check a batch once and return the parsed JSON responses by key, or None while it is running
+    
+    A batch still running after the deadline (a time.monotonic() value) is cancelled. Any key
+    the batch did not return, because it was cancelled or its request failed, is requested online.
+    """
+    async with get_client() as client:
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status in ("completed", "failed", "expired", "cancelled"):
+            enhanced = await read_batch_results(client, batch, requests)
+        elif time.monotonic() < deadline:
+            return None
+        else:
+            await client.batches.cancel(batch_id)
+            enhanced = {}
+    
+    missing = {key: request for key, request in requests.items() if key not in enhanced}
+    if missing:
+        enhanced.update(await enhance_requests(missing))
+    return enhanced
+
+async def enhance_requests(requests, on_progress=None):
+    """
+    Run several chat requests online and return their parsed JSON responses by key
+    
+    Requests are issued concurrently, so the wait is for the slowest request rather than
+    every request back to back. on_progress(key, text) receives the streamed text of each
+    request as it arrives.
+    """
+    async with get_client() as client:
+        results = await asyncio.gather(*(
+            request_enhancement(
+                client, request,
+                functools.partial(on_progress, key) if on_progress else None
+            )
+            for key, request in requests.items()
+        ))
+        return dict(zip(requests, results))
+
+def requests_cache_key(requests):
+    """Serialize chat requests into a response cache key that covers the model, prompts and schema"""
+    return json.dumps(requests, sort_keys=True)
+
+# Responses are kept for a day, up to 100 distinct requests
+@st.cache_data(ttl=24 * 3600, max_entries=100, show_spinner=False)
+def cached_enhancement(requests_key, _requests):
+    """
+    Return the enhanced JSON for each request, only calling the API on a miss
+    
+    requests_key is the requests serialized by requests_cache_key. Streamlit hashes only
+    it (underscore-prefixed arguments are skipped), so a response is reused only for the
+    exact same model, prompts and schema. Errors are raised, not cached.
+    
+    While responses stream in, each request's partial output is shown in a preview. The
+    previews are created inside this function because Streamlit replays a cached
+    function's elements on a cache hit and needs them to belong to it.
+    """
+    previews = {key: st.empty() for key in _requests}
+    
+    def show_progress(key, text):
+        previews[key].code(text, language="json")
+    
+    enhanced = asyncio.run(enhance_requests(_requests, show_progress))
+    
+    for preview in previews.values():
+        preview.empty()
+    return enhanced
+
+def enhance_in_batch(requests):
+    """
+    Return the cheap-mode result for these requests, submitting them as a batch if needed
+    
+    Finished batch results are kept in the session. Until they arrive, the batch is
+    recorded in st.session_state.pending_batches and the app is rerun so that
+    poll_pending_batches can check on it without blocking the page.
+    """
+    requests_key = requests_cache_key(requests)
+    batch_results = st.session_state.setdefault("batch_results", {})
+    if requests_key in batch_results:
+        return batch_results[requests_key]
+    
+    pending = st.session_state.setdefault("pending_batches", {})
+    if requests_key not in pending:
+        now = time.monotonic()
+        pending[requests_key] = {
+            "id": asyncio.run(submit_batch(requests)),
+            "requests": requests,
+            "deadline": now + BATCH_TIMEOUT_SECONDS,
+            "delay": BATCH_POLL_INITIAL_DELAY,
+            "next_poll": now + BATCH_POLL_INITIAL_DELAY
+        }
+    st.rerun()
+
+@st.fragment(run_every=BATCH_POLL_INITIAL_DELAY)
+def poll_pending_batches():
+    """
+    Check pending cheap-mode batches on a timer, rerunning only this fragment
+    
+    Each batch is retrieved with exponential backoff between checks. When one finishes,
+    its results are stored in the session and the whole app is rerun to announce them.
+    """
+    pending = st.session_state.pending_batches
+    finished = False
+    
+    for requests_key, batch in list(pending.items()):
+        if time.monotonic() < batch["next_poll"]:
+            continue
+        
+        try:
+            enhanced = asyncio.run(poll_batch(batch["id"], batch["requests"], batch["deadline"]))
+        except Exception as e:
+            del pending[requests_key]
+            st.session_state.batch_notice = ("error", f"Error calling OpenAI API: {str(e)}")
+            finished = True
+            continue
         
-        return json.loads(response.choices[0].message.content)
+        if enhanced is None:
+            batch["next_poll"] = time.monotonic() + batch["delay"]
+            batch["delay"] = min(batch["delay"] * 2, BATCH_POLL_MAX_DELAY)
+            continue
+        
+        del pending[requests_key]
+        st.session_state.batch_results[requests_key] = enhanced
+        st.session_state.batch_notice = ("success", "✅ Cheap mode results are ready. Click Build Resume to download.")
+        finished = True
+    
+    if finished:
+        st.rerun()
+    st.info("⏳ Waiting for the OpenAI Batch API. You can keep using the page.")
+
+def process_job_description(role, job_description, model="gpt-4.1-nano", batch_mode=False):
+    """
+    Process job description with OpenAI API and get enhanced resume content for a role
+    
+    Each section (experience, projects, skills) is tailored by its own request and the
+    requests run in parallel. Sections the model leaves out keep their original content.
+    In cheap mode the requests are sent as a batch, and the resume is built on a later
+    click once poll_pending_batches has collected the results.
+    """
+    resume_json = RESUMES[role]
+    section_json_strs = RESUME_JSON_STR[role]
+    requests = {
+        section: build_chat_request(
+            USER_PROMPT_TMPL.substitute(
+                job_description=job_description,
+                resume_json=section_json_strs[section],
+                output_instructions=SECTION_OUTPUT_INSTRUCTIONS
+            ),
+            model,
+            "resume_section",
+            object_schema({section: SECTION_SCHEMAS[section]})
+        )
+        for section, content in resume_json.items()
+        if content
+    }
+    
+    try:
+        if batch_mode:
+            enhanced = enhance_in_batch(requests)
+        else:
+            enhanced = cached_enhancement(requests_cache_key(requests), requests)
+        return {
+            section: unpack_section(section, enhanced[section][section]) if section in enhanced else content
+            for section, content in resume_json.items()
+        }
     except Exception as e:
         st.error(f"Error calling OpenAI API: {str(e)}")
         return None
 
-# Streamlit App
-def main():
-    st.title("📝 Resume Builder2.0")
-
-    # Sidebar for API key
-    model_option = "gpt-4.1-nano"
+def process_job_descriptions(job_description, model="gpt-4.1-nano", batch_mode=False):
+    """
+    Enhance every role's resume against one job description in a single API call
+    
+    Example output: {"Software Developer": {...enhanced...}, "Full Stack": {...enhanced...}}
+    
+    Sharing one request lets every resume variant reuse the same system prompt and
+    job description instead of paying for them once per variant.
+    """
+    user_prompt = USER_PROMPT_TMPL.substitute(
+        job_description=job_description,
+        resume_json=RESUMES_JSON_STR,
+        output_instructions=VARIANTS_OUTPUT_INSTRUCTIONS
+    )
+    request = build_chat_request(user_prompt, model, "resume_variants", VARIANTS_SCHEMA)
+    
+    try:
+        requests = {"variants": request}
+        if batch_mode:
+            enhanced = enhance_in_batch(requests)["variants"]
+        else:
+            enhanced = cached_enhancement(requests_cache_key(requests), requests)["variants"]
+        unpacked = {
+            label: {
+                section: unpack_section(section, content)
+                for section, content in enhanced[label].items()
+            }
+            for label in PACKED_ROLES
+        }
+    except Exception as e:
+        st.error(f"Error calling OpenAI API: {str(e)}")
+        return None
+    
+    return {label: unpacked[VARIANT_SOURCE[label]] for label in RESUMES}
 
-    # File uploader for resume template
-    uploaded_file = "new_resume_half.docx"
-    software_dev_resume = {
+software_dev_resume = {
   "experience": [
     {
       "Software Developer | University of Florida | Nov, 2024 - Present": [
@@ -339,8 +744,8 @@ def main():
     
   ]
   }
-    data_dev_resume = software_dev_resume
-    software_testing_resume = {
+data_dev_resume = software_dev_resume
+software_testing_resume = {
   "experience": [
       {
       " QA Automation Intern | Medha Foundation | Jul, 2022 - Nov, 2022": [
@@ -396,7 +801,7 @@ def main():
   ]
   
   }
-    full_stack_resume = {
+full_stack_resume = {
   "experience": [
     {
       "Software Developer | University of Florida | Nov, 2024 - Present": [
@@ -466,7 +871,7 @@ def main():
     
   ]
   }
-    software_QA_resume = {
+software_QA_resume = {
   "experience": [
     {
       "Software Developer | University of Florida | Nov, 2024 - Present": [
@@ -536,59 +941,114 @@ def main():
     
   ]
   }
+
+RESUMES = {
+    "Software Developer": software_dev_resume,
+    "Data Science": data_dev_resume,
+    "Full Stack": full_stack_resume,
+    "Software Testing": software_testing_resume,
+    "Software QA": software_QA_resume,
+}
+
+def serialize_resume(resume_json):
+    """Serialize each resume section on its own, as it is sent in the per-section prompts"""
+    return {
+        section: json.dumps({section: pack_section(section, content)}, separators=(",", ":"))
+        for section, content in resume_json.items()
+    }
+
+# The resumes never change, so their prompt JSON is built once at import
+RESUME_JSON_STR = {role: serialize_resume(resume) for role, resume in RESUMES.items()}
+
+def group_shared_resumes(resume_json_strs):
+    """Map each role to the first role whose serialized resume is identical to its own"""
+    first_role = {}
+    return {
+        role: first_role.setdefault(tuple(sections.items()), role)
+        for role, sections in resume_json_strs.items()
+    }
+
+# Roles sharing a resume are sent and enhanced once, under the first role that uses it
+VARIANT_SOURCE = group_shared_resumes(RESUME_JSON_STR)
+PACKED_ROLES = list(dict.fromkeys(VARIANT_SOURCE.values()))
+RESUMES_JSON_STR = json.dumps(
+    {
+        role: {section: pack_section(section, content) for section, content in RESUMES[role].items()}
+        for role in PACKED_ROLES
+    },
+    separators=(",", ":")
+)
+VARIANTS_OUTPUT_INSTRUCTIONS = (
+    "The resume data above contains several resumes keyed by label "
+    f"({', '.join(json.dumps(label) for label in PACKED_ROLES)}). Enhance each resume independently "
+    "and return it under the same label."
+)
+VARIANTS_SCHEMA = object_schema({label: object_schema(SECTION_SCHEMAS) for label in PACKED_ROLES})
+
+# Streamlit App
+def main():
+    st.title("📝 Resume Builder2.0")
+
+    # Sidebar for API key
+    model_option = "gpt-4.1-nano"
+
+    # File uploader for resume template
+    uploaded_file = "new_resume_half.docx"
     job_description = st.text_area("Paste job description here", height=150)
-    type_of_role = st.selectbox("Select type of role", ["Software Developer", "Data Science", "Full Stack", "Software Testing","Software QA"])
+    type_of_role = st.selectbox("Select type of role", list(RESUMES))
+    all_roles = st.checkbox("Build all role variants")
+    batch_mode = st.checkbox("Cheap mode (OpenAI Batch API, can take several minutes)")
+
+    # Announce a finished cheap-mode batch and keep checking any that are still running
+    notice = st.session_state.pop("batch_notice", None)
+    if notice:
+        kind, message = notice
+        if kind == "error":
+            st.error(message)
+        else:
+            st.success(message)
+    if st.session_state.get("pending_batches"):
+        poll_pending_batches()
 
     if uploaded_file :
         try:
             # Parse JSON input
-            if type_of_role == "Software Developer": resume_data = software_dev_resume
-            elif type_of_role == "Data Science": resume_data = data_dev_resume
-            elif type_of_role == "Full Stack": resume_data = full_stack_resume
-            elif type_of_role == "Software Testing": resume_data = software_testing_resume
-            else : resume_data = software_QA_resume
+            resume_data = RESUMES[type_of_role]
             
             if st.button("Build Resume"):
                 with st.spinner("Processing..."):
-                    # Load document
-                    doc = load_docx(uploaded_file)
-                    
-                    # If using OpenAI, get optimized content
-                    if job_description :
-                        enhanced_data = process_job_description(resume_data, job_description, model_option)
-                        if enhanced_data:
-                            resume_data = enhanced_data
-                            st.success("Resume content optimized for job description!")
-                    
-                    # Add experience section
-                    if "experience" in resume_data and resume_data["experience"]:
-                        success = add_content_to_section(doc, "EXPERIENCE", resume_data["experience"])
-                        if success:
-                            st.success("✅ Added experience section")
-                        else:
-                            st.error("❌ Failed to add experience section")
-                    
-                    # Add projects section
-                    if "projects" in resume_data and resume_data["projects"]:
-                        success = add_content_to_section(doc, "PROJECTS", resume_data["projects"])
-                        if success:
-                            st.success("✅ Added projects section")
-                        else:
-                            st.error("❌ Failed to add projects section")
-                    
-                    if "skills" in resume_data and resume_data["skills"]:
-                        success = add_skills_to_section(doc, "TECHNICAL SKILLS", resume_data["skills"])
-                        if success:
-                            st.success("✅ Added technical skills section")
-                        else:
-                            st.error("❌ Failed to add technical skills section")
-                    
-                    # Save and offer download
-                    output_docx = save_docx(doc)
-                    st.download_button("📥 Download Complete Resume", 
-                                      data=output_docx, 
-                                      file_name="Complete_Resume.docx",
-                                      mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+                    if all_roles:
+                        variants = dict(RESUMES)
+                        
+                        # One API call tailors every role variant at once
+                        if job_description :
+                            enhanced_variants = process_job_descriptions(job_description, model_option, batch_mode)
+                            if enhanced_variants:
+                                variants.update(enhanced_variants)
+                                st.success("Resume content optimized for job description!")
+                        
+                        for role, variant_data in variants.items():
+                            st.subheader(role)
+                            output_docx = build_resume_bytes(uploaded_file, json.dumps(variant_data))
+                            st.download_button(f"📥 Download {role} Resume", 
+                                              data=output_docx, 
+                                              file_name=f"{role.replace(' ', '_')}_Resume.docx",
+                                              mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                                              key=role)
+                    else:
+                        # If using OpenAI, get optimized content
+                        if job_description :
+                            enhanced_data = process_job_description(type_of_role, job_description, model_option, batch_mode)
+                            if enhanced_data:
+                                resume_data = enhanced_data
+                                st.success("Resume content optimized for job description!")
+                        
+                        # Save and offer download
+                        output_docx = build_resume_bytes(uploaded_file, json.dumps(resume_data))
+                        st.download_button("📥 Download Complete Resume", 
+                                          data=output_docx, 
+                                          file_name="Complete_Resume.docx",
+                                          mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
         except json.JSONDecodeError:
             st.error("Invalid JSON format. Please check your input.")
 